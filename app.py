@@ -3,34 +3,175 @@
 # Streamlit Chatbot using Groq + LangChain (Pro version)
 # Features:
 # - Chat bubbles UI (Streamlit chat)
-# - Conversation memory (Buffer / Summary / Window)
+# - Conversation memory (Summary+Buffer / Buffer / Summary / Window / Relevant)
 # - Mode switcher for system prompts (Teaching, Coding, Translator, General)
-# - Typing effect for assistant replies
+# - Token streaming for assistant replies
+# - Response cache for repeated deterministic turns
+# - Chat history persisted per session (survives browser refresh)
 # - Download chat history (.txt)
 # - Clear chat button
 # -------------------------------------------------------------
 
 from dotenv import load_dotenv
+import hashlib
 import os
+import re
 import time
+import uuid
 import streamlit as st
 
-from langchain_groq import ChatGroq
-from langchain.memory import (
-    ConversationBufferMemory,
-    ConversationSummaryMemory,
-    ConversationBufferWindowMemory,
-)
-from langchain.chains import ConversationChain
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from prompts import PRESET_PROMPTS, get_preset
+
+# LangChain modules are imported after the API key check below (and client
+# libraries inside the cached factories), so the key-entry screen renders
+# without paying their import cost on a cold start.
 
 
 # ---------------- Setup & Config ----------------
 load_dotenv()
 
 st.set_page_config(page_title="Groq Chatbot with Memory", page_icon="🤖")
+
+# ----------- Custom CSS with Header & Footer ------------
+# Emitted right after page config so it sits at a fixed position in the page:
+# Streamlit sees an unchanged element on every rerun instead of one that moves
+# down as the transcript grows, and the styling also applies to the key screen.
+CSS_BLOCK = """
+<style>
+/* Background Image */
+.stApp {
+    background-image: url("https://media.istockphoto.com/id/1488335095/vector/3d-vector-robot-chatbot-ai-in-science-and-business-technology-and-engineering-concept.jpg?s=612x612&w=0&k=20&c=MSxiR6V1gROmrUBe1GpylDXs0D5CHT-mn0Up8D50mr8=");
+    background-size: cover;
+    background-position: center;
+    background-repeat: no-repeat;
+}
+
+/* Top-right Header */
+#top-header {
+    position: fixed;
+    top: 80px;
+    right: 20px;
+    background-color: rgba(0,0,0,0.5);
+    padding: 8px 16px;
+    border-radius: 8px;
+    color: white;
+    font-size: 18px;
+    font-weight: bold;
+    z-index: 100;
+}
+
+/* Bottom-left Footer */
+#bottom-footer {
+    position: fixed;
+    bottom: 10px;
+    left: 300px;
+    background-color: rgba(0,0,0,0.5);
+    padding: 6px 14px;
+    border-radius: 6px;
+    color: white;
+    font-size: 14px;
+    z-index: 100;
+}
+</style>
+
+<div id="top-header">Respected Sir Shahzaib & Sir Ali Hamza</div>
+<div id="bottom-footer">Developed by Faraz Hussain</div>
+"""
+st.markdown(CSS_BLOCK, unsafe_allow_html=True)
+
 st.title("🤖 Groq Chatbot with Memory — Pro")
 
+# The Translator preset answers side-by-side in these languages; with the
+# sidebar toggle on, each side is requested separately and both run concurrently.
+TRANSLATION_PANES = ("Roman Urdu", "English")
+
+# Cap on each summary the summarizer LLM emits, so the running summary that is
+# resent every turn cannot grow without bound
+SUMMARY_MAX_TOKENS = 256
+
+# Reasoning models open every reply with a <think> block, which a 256-token cap
+# would cut off before any summary is written (hidden reasoning still counts
+# against the cap). Summaries therefore always use a non-reasoning model.
+REASONING_MODELS = frozenset({"qwen/qwen3-32b", "deepseek-r1-distill-llama-70b"})
+SUMMARY_FALLBACK_MODEL = "llama-3.3-70b-versatile"
+
+
+# --------------- Cached Resources ---------------
+@st.cache_resource(show_spinner=False)
+def get_llm(model_name, temperature, max_tokens, api_key, streaming=False):
+    # One client (and HTTP connection pool) per config, shared across reruns
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        model_name=model_name,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        api_key=api_key,
+        streaming=streaming,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache():
+    # Exact-match completion cache, shared across sessions and restarts
+    from langchain_community.cache import SQLiteCache
+
+    return SQLiteCache(database_path=".groq_cache.db")
+
+
+@st.cache_resource(show_spinner=False)
+def get_inflight():
+    # Requests currently running, shared by all sessions of this server
+    from singleflight import SingleFlight
+
+    return SingleFlight()
+
+
+@st.cache_resource(show_spinner="Loading embedding model…")
+def get_embedder():
+    # Small local model (384-dim); only imported when Relevant memory is used
+    from fastembed import TextEmbedding
+
+    model = TextEmbedding("BAAI/bge-small-en-v1.5")
+    return lambda texts: list(model.embed(texts))
+
+
+def format_history(turns):
+    # Download (.txt) formatting for (role, content) transcript entries
+    labels = {"user": "HUMAN", "assistant": "AI"}
+    return "\n\n".join(f"{labels[role]}: {content}" for role, content in turns)
+
+
+# --------------- Helpers ---------------
+def sentence_chunks(text, delay):
+    # Split after sentence-ending punctuation, keeping all whitespace/newlines
+    for chunk in re.split(r"(?<=[.!?])(?=\s)", text):
+        yield chunk
+        time.sleep(delay)
+
+
+def reveal(text, delay):
+    # Show an already-complete reply (cache hit, batched translation):
+    # at once by default, or sentence by sentence for a typing feel
+    if delay:
+        st.write_stream(sentence_chunks(text, delay))
+    else:
+        st.markdown(text)
+
+
+# --------------- Session Persistence ---------------
+# A stable id in the URL lets a browser refresh pick the same chat back up from
+# disk instead of starting (and re-summarizing) from scratch. See "Chat
+# Persistence" in the README for its limits (one tab per sid, no cleanup).
+SESSIONS_DIR = ".sessions"
+session_id = st.query_params.get("sid", "")
+if not re.fullmatch(r"[0-9a-f]{32}", session_id):
+    session_id = uuid.uuid4().hex
+    st.query_params["sid"] = session_id
+os.makedirs(SESSIONS_DIR, exist_ok=True)
+history_path = os.path.join(SESSIONS_DIR, f"{session_id}.json")
+summary_state_path = os.path.join(SESSIONS_DIR, f"{session_id}.summary.json")
+
 
 # --------------- Sidebar Controls ---------------
 with st.sidebar:
@@ -57,55 +198,80 @@ with st.sidebar:
 
     temperature = st.slider("Temperature (creativity)", 0.0, 1.0, 0.7)
     max_tokens = st.slider("Max Tokens", 50, 3000, 512)
+    typing_delay = st.slider(
+        "Typing delay (s per sentence)",
+        0.0,
+        0.5,
+        0.0,
+        help="Only applies to replies that are not streamed, e.g. cached answers.",
+    )
 
     # Mode switcher → presets for system prompt
     mode = st.selectbox(
         "Assistant Mode",
-        ["🎓 Teaching Assistant", "👨‍💻 Coding Helper", "🌍 Translator", "🧠 General Assistant"],
+        list(PRESET_PROMPTS),
         index=0,
     )
 
-    preset_prompts = {
-        "🎓 Teaching Assistant": (
-            "You are a helpful, concise teaching assistant. Use short, clear explanations, ideally within 3 lines."
-        ),
-        "👨‍💻 Coding Helper": (
-            "You are a precise coding assistant. Respond with minimal prose, correct code, and brief tips."
-        ),
-        "🌍 Translator": (
-            "You are a professional translator. Preserve meaning and tone. If user doesn't specify, translate to Roman Urdu and English side-by-side."
-        ),
-        "🧠 General Assistant": (
-            "You are a friendly, efficient assistant. Be brief, accurate, and helpful."
-        ),
-    }
-
-    default_system_prompt = preset_prompts.get(mode, preset_prompts["🧠 General Assistant"]) 
+    default_system_prompt = get_preset(mode)
     system_prompt = st.text_area(
         "System Prompt (Rules)",
         value=default_system_prompt,
         help="Edit the assistant's behavior here.",
     )
 
+    split_translation = False
+    if mode == "🌍 Translator":
+        split_translation = st.toggle(
+            "Parallel Roman Urdu + English",
+            value=False,
+            help=(
+                "Request each language separately and run both at once: faster replies, but the system "
+                "prompt and history are sent twice, so input tokens double. Leave off when asking for "
+                "another target language."
+            ),
+        )
+
     st.caption("💡 Tip: Lower temperature for factual tasks; increase for brainstorming.")
 
     # Memory configuration
     memory_type = st.selectbox(
         "Memory Type",
-        ["Buffer (all)", "Summary (long chats)", "Window (last N)"],
+        [
+            "Summary+Buffer (token budget)",
+            "Buffer (all)",
+            "Summary (long chats)",
+            "Window (last N)",
+            "Relevant (top-k)",
+        ],
         index=0,
         help=(
-            "Buffer keeps everything, Summary compresses old context, Window only keeps the last N exchanges."
+            "Summary+Buffer keeps recent turns verbatim and summarizes older ones once the token budget is exceeded, "
+            "Buffer keeps everything, Summary compresses old context without extra API calls, Window only keeps the last N exchanges, "
+            "Relevant sends only the past messages most similar to your question plus the last few."
         ),
     )
 
     window_k = None
     if memory_type == "Window (last N)":
-        window_k = st.slider("Window size (messages)", 2, 20, 6)
+        window_k = st.slider("Window size (exchanges)", 2, 20, 6)
+
+    memory_token_limit = None
+    if memory_type == "Summary+Buffer (token budget)":
+        memory_token_limit = st.slider("Memory token budget", 256, 4096, 1024)
 
     if st.button("🗑️ Clear Chat"):
-        if "memory" in st.session_state:
-            st.session_state.memory.clear()
+        # The history file is the source of truth: clear it even when no memory
+        # exists yet (e.g. after a refresh, before the API key is re-entered)
+        from chat_memory import CachedFileChatMessageHistory
+
+        store = st.session_state.get("history_store") or CachedFileChatMessageHistory(history_path)
+        store.clear()
+        if os.path.exists(summary_state_path):
+            os.remove(summary_state_path)
+        # Rebuilt from the empty file on the next run
+        for key in ("history_store", "memory", "_mem_config", "transcript", "history_text"):
+            st.session_state.pop(key, None)
         st.success("Chat history cleared!")
         st.rerun()
 
@@ -114,58 +280,113 @@ if not GROQ_API_KEY:
     st.warning("⚠️ Please enter your Groq API key in the sidebar to start chatting.")
     st.stop()
 
+# --------------- Deferred Imports ---------------
+from langchain.memory import ConversationBufferMemory
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.messages import AIMessage, HumanMessage, trim_messages
+from langchain_core.outputs import Generation
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from chat_memory import (
+    CachedFileChatMessageHistory,
+    EstimatedSummaryBufferMemory,
+    HeuristicSummaryMemory,
+    RelevanceMemory,
+    TurnHistory,
+    build_chat_runnable,
+)
+
 # --------------- Initialize Memory ---------------
-# Recreate memory when memory type or window size changes
-mem_key = f"memory::{memory_type}::{window_k}"
+# One message store per session; every memory type is a view over it, so
+# switching type, window size or token budget never discards history.
+if "history_store" not in st.session_state:
+    st.session_state.history_store = CachedFileChatMessageHistory(history_path)
+chat_history = st.session_state.history_store
+
+# Recreate the memory wrapper only when the memory type changes
+mem_key = f"memory::{memory_type}"
 if "_mem_config" not in st.session_state or st.session_state.get("_mem_config") != mem_key:
-    # Create a fresh memory object based on current settings
-    if memory_type == "Buffer (all)":
-        memory = ConversationBufferMemory(return_messages=True)
+    summary_model = SUMMARY_FALLBACK_MODEL if model_name in REASONING_MODELS else model_name
+    if memory_type == "Summary+Buffer (token budget)":
+        # Recent turns stay verbatim; older ones are folded into a running summary
+        summarizer_llm = get_llm(summary_model, 0, SUMMARY_MAX_TOKENS, GROQ_API_KEY)
+        memory = EstimatedSummaryBufferMemory(
+            llm=summarizer_llm,
+            max_token_limit=memory_token_limit or 1024,
+            chat_memory=chat_history,
+            state_path=summary_state_path,
+            return_messages=True,
+        )
+        memory.load_state()
     elif memory_type == "Summary (long chats)":
-        # Needs an LLM to summarize; use a lightweight Groq model for summaries too
-        summarizer_llm = ChatGroq(model_name=model_name, temperature=0, api_key=GROQ_API_KEY)
-        memory = ConversationSummaryMemory(llm=summarizer_llm, return_messages=True)
-    elif memory_type == "Window (last N)":
-        memory = ConversationBufferWindowMemory(k=window_k or 6, return_messages=True)
+        # Older turns are summarized locally; the LLM is only a fallback
+        summarizer_llm = get_llm(summary_model, 0, SUMMARY_MAX_TOKENS, GROQ_API_KEY)
+        memory = HeuristicSummaryMemory(llm=summarizer_llm, chat_memory=chat_history, return_messages=True)
+    elif memory_type == "Relevant (top-k)":
+        try:
+            embedder = get_embedder()
+        except ImportError:
+            st.error("⚠️ Relevant memory needs the `fastembed` package: `pip install fastembed`.")
+            st.stop()
+        memory = RelevanceMemory(embed=embedder, chat_memory=chat_history, return_messages=True)
     else:
-        memory = ConversationBufferMemory(return_messages=True)
+        # Buffer and Window share the full buffer; Window is trimmed per turn
+        memory = ConversationBufferMemory(chat_memory=chat_history, return_messages=True)
 
     st.session_state.memory = memory
     st.session_state._mem_config = mem_key
 
+if isinstance(st.session_state.memory, EstimatedSummaryBufferMemory):
+    st.session_state.memory.max_token_limit = memory_token_limit
+
 # --------------- Build LLM ---------------
-llm = ChatGroq(
-    model_name=model_name,
-    temperature=temperature,
-    max_tokens=max_tokens,
-    api_key=GROQ_API_KEY,
-)
+llm = get_llm(model_name, temperature, max_tokens, GROQ_API_KEY, streaming=True)
 
 # --------------- Conversation Chain ---------------
-prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", system_prompt),
-        MessagesPlaceholder(variable_name="history"),
-        ("human", "{input}"),
-    ]
-)
-
-conversation = ConversationChain(
-    llm=llm,
-    memory=st.session_state.memory,
-    prompt=prompt,
-    verbose=False,
-)
+# Static system prompt first, then history, then the new input: the longest
+# unchanged prefix stays contiguous so provider-side prefix caching can hit.
+# Only rebuild the template when the system prompt text actually changes.
+prompt_key = hashlib.sha256(system_prompt.encode()).hexdigest()
+if st.session_state.get("_prompt_key") != prompt_key:
+    st.session_state.prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", system_prompt),
+            MessagesPlaceholder(variable_name="history"),
+            ("human", "{input}"),
+        ]
+    )
+    st.session_state._prompt_key = prompt_key
+prompt = st.session_state.prompt
+
+# LCEL chain wrapped in RunnableWithMessageHistory: it reads this turn's memory
+# view and appends the new human/AI messages to the session store once the
+# reply has finished streaming. Reused across reruns until an input changes.
+chain_key = (prompt_key, model_name, temperature, max_tokens)
+if st.session_state.get("_chain_key") != chain_key:
+    st.session_state.turn_histories = {}
+    st.session_state.conversation = prompt | llm | StrOutputParser()
+    st.session_state.runnable = build_chat_runnable(
+        st.session_state.conversation, st.session_state.turn_histories
+    )
+    st.session_state._chain_key = chain_key
+conversation = st.session_state.conversation
+runnable = st.session_state.runnable
 
 # --------------- Helper: Render existing history as chat bubbles ---------------
-for msg in st.session_state.memory.chat_memory.messages:
-    role = getattr(msg, "type", "ai")  # 'human' or 'ai'
-    if role == "human":
-        st.chat_message("user").markdown(msg.content)
-    else:
-        st.chat_message("assistant").markdown(msg.content)
+# Streamlit drops any element that is not re-emitted on a rerun, so the bubbles
+# are redrawn every time. What we skip is re-walking the memory: the transcript
+# (and its download text) is built from it once per session and new turns are
+# appended as they happen.
+if "transcript" not in st.session_state:
+    st.session_state.transcript = [
+        ("user" if getattr(msg, "type", "ai") == "human" else "assistant", msg.content)
+        for msg in st.session_state.memory.chat_memory.messages
+    ]
+    st.session_state.history_text = format_history(st.session_state.transcript)
+for role, content in st.session_state.transcript:
+    st.chat_message(role).markdown(content)
 
-# --------------- Chat Input & Typing Effect ---------------
+# --------------- Chat Input & Streaming ---------------
 user_input = st.chat_input("Type your message…")
 
 
@@ -173,28 +394,110 @@ if user_input:
     # Show user's message bubble immediately
     st.chat_message("user").markdown(user_input)
 
-    # Get assistant full response once, then reveal with typing effect
-    full_response = conversation.predict(input=user_input)
+    history = st.session_state.memory.load_memory_variables({"input": user_input})["history"]
+    if memory_type == "Window (last N)":
+        # Last N exchanges (2N messages) plus any system messages, starting on
+        # a user turn, matching ConversationBufferWindowMemory(k=N)
+        history = trim_messages(
+            history,
+            max_tokens=2 * window_k,
+            token_counter=len,
+            strategy="last",
+            include_system=True,
+            start_on="human",
+        )
+    inputs = {"history": history, "input": user_input}
+
+    # Only deterministic (temperature 0) replies are worth serving from cache.
+    # The rendered prompt covers system prompt + history + input. Entries are
+    # scoped to a fingerprint of the API key, so a session is never served a
+    # completion that was billed to somebody else's key. Split translations
+    # are keyed apart from single replies, which have a different format.
+    split = split_translation and system_prompt == get_preset(mode)
+    cache = get_response_cache() if temperature == 0 else None
+    cache_prompt = prompt.invoke(inputs).to_string()
+    key_fingerprint = hashlib.sha256(GROQ_API_KEY.encode()).hexdigest()[:16]
+    cache_llm_string = f"{model_name}::{temperature}::{max_tokens}::{key_fingerprint}"
+    if split:
+        cache_llm_string += "::split=" + "+".join(TRANSLATION_PANES)
+    cached = cache.lookup(cache_prompt, cache_llm_string) if cache else None
+
+    def generate():
+        # Returns the reply; both paths record the turn in the session store
+        if split:
+            # One request per language, dispatched in parallel by batch()
+            pane_inputs = [
+                {**inputs, "input": f"{user_input}\n\n(Reply with the {lang} translation only.)"}
+                for lang in TRANSLATION_PANES
+            ]
+            with st.spinner("Translating…"):
+                replies = conversation.batch(pane_inputs)
+            text = "\n\n".join(
+                f"**{lang}:** {reply}" for lang, reply in zip(TRANSLATION_PANES, replies)
+            )
+            reveal(text, typing_delay)
+            chat_history.add_messages([HumanMessage(content=user_input), AIMessage(content=text)])
+            return text
+        # Stream tokens into the assistant bubble as they arrive
+        st.session_state.turn_histories[session_id] = TurnHistory(history, chat_history)
+        return st.write_stream(
+            runnable.stream(
+                {"input": user_input},
+                config={"configurable": {"session_id": session_id}},
+            )
+        )
+
+    # An identical request already in flight for this chat (same sid, API key,
+    # model settings and rendered prompt, e.g. a double submit from a duplicated
+    # tab) shares that one Groq call. Same sid means the same history file, and
+    # the leader has already recorded the turn there.
+    flight_key = hashlib.blake2b(
+        repr((session_id, cache_llm_string, cache_prompt)).encode(), digest_size=16
+    ).hexdigest()
+
+    shared = False
+    with st.chat_message("assistant"):
+        if cached:
+            full_response = cached[0].text
+            reveal(full_response, typing_delay)
+            st.toast("⚡ Served from cache")
+        else:
+            full_response, shared = get_inflight().do(flight_key, generate)
+            if shared:
+                reveal(full_response, typing_delay)
+
+    if cache and not cached:
+        cache.update(cache_prompt, cache_llm_string, [Generation(text=full_response)])
+
+    if cached:
+        # Cache hits never ran generate(), so record the turn here
+        chat_history.add_messages([HumanMessage(content=user_input), AIMessage(content=full_response)])
+    new_turns = [("user", user_input), ("assistant", full_response)]
+    st.session_state.transcript += new_turns
+    st.session_state.history_text = "\n\n".join(
+        part for part in (st.session_state.history_text, format_history(new_turns)) if part
+    )
 
-    # Typing animation
-    placeholder = st.chat_message("assistant").empty()
-    accum = ""
-    for ch in full_response:
-        accum += ch
-        placeholder.markdown(accum)
-        time.sleep(0.012)  # typing speed
+    if isinstance(st.session_state.memory, EstimatedSummaryBufferMemory):
+        # Summarize now, after the reply is on screen, rather than before the next one
+        st.session_state.memory.prune()
+
+# --------------- Memory Budget Meter ---------------
+# Estimated locally, so no tokenizer or API call per rerun. The budget covers
+# the verbatim recent turns; the running summary is reported on top of it.
+if isinstance(st.session_state.memory, EstimatedSummaryBufferMemory):
+    recent_tokens = st.session_state.memory.recent_tokens()
+    summary_tokens = st.session_state.memory.summary_tokens()
+    st.sidebar.progress(
+        min(recent_tokens / memory_token_limit, 1.0),
+        text=f"Recent turns ≈{recent_tokens}/{memory_token_limit} tokens (+ summary ≈{summary_tokens})",
+    )
 
 # --------------- Download Chat History ---------------
-if st.session_state.memory.chat_memory.messages:
-    history_lines = []
-    for m in st.session_state.memory.chat_memory.messages:
-        role = getattr(m, "type", "ai").upper()
-        history_lines.append(f"{role}: {m.content}")
-    history_text = "\n\n".join(history_lines)
-
+if st.session_state.transcript:
     st.download_button(
         "📥 Download Chat (.txt)",
-        data=history_text,
+        data=st.session_state.history_text,
         file_name="chat_history.txt",
         mime="text/plain",
         help="Save the full conversation as a text file.",
@@ -204,47 +507,3 @@ if st.session_state.memory.chat_memory.messages:
 st.caption(
     "Made with LangChain + Groq. Switch modes and memory types from the sidebar for best results."
 )
-
-
-# ----------- Custom CSS with Header & Footer ------------
-st.markdown("""
-<style>
-/* Background Image */
-.stApp {
-    background-image: url("https://media.istockphoto.com/id/1488335095/vector/3d-vector-robot-chatbot-ai-in-science-and-business-technology-and-engineering-concept.jpg?s=612x612&w=0&k=20&c=MSxiR6V1gROmrUBe1GpylDXs0D5CHT-mn0Up8D50mr8=");
-    background-size: cover;
-    background-position: center;
-    background-repeat: no-repeat;
-}
-
-/* Top-right Header */
-#top-header {
-    position: fixed;
-    top: 80px;
-    right: 20px;
-    background-color: rgba(0,0,0,0.5);
-    padding: 8px 16px;
-    border-radius: 8px;
-    color: white;
-    font-size: 18px;
-    font-weight: bold;
-    z-index: 100;
-}
-
-/* Bottom-left Footer */
-#bottom-footer {
-    position: fixed;
-    bottom: 10px;
-    left: 300px;
-    background-color: rgba(0,0,0,0.5);
-    padding: 6px 14px;
-    border-radius: 6px;
-    color: white;
-    font-size: 14px;
-    z-index: 100;
-}
-</style>
-
-<div id="top-header">Respected Sir Shahzaib & Sir Ali Hamza</div>
-<div id="bottom-footer">Developed by Faraz Hussain</div>
-""", unsafe_allow_html=True)
@@ -0,0 +1,383 @@
+# chat_memory.py
+# -------------------------------------------------------------
+# Memory helpers for the Groq chatbot
+# - est_tokens: cheap token estimate (~4 chars per token), no tokenizer or network
+# - EstimatedSummaryBufferMemory: Summary+Buffer memory budgeted with est_tokens
+# - heuristic_summary / HeuristicSummaryMemory: summaries without an LLM call
+# - RelevanceMemory: only the past messages most similar to the new input
+# - TurnHistory / build_chat_runnable: a memory's view in RunnableWithMessageHistory
+# - CachedFileChatMessageHistory: file-backed history parsed once, locked writes
+# -------------------------------------------------------------
+
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Optional
+
+import numpy as np
+from langchain.memory import ConversationBufferMemory, ConversationSummaryBufferMemory
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_community.chat_message_histories import FileChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import SystemMessage, get_buffer_string, messages_from_dict, messages_to_dict
+from langchain_core.runnables.history import RunnableWithMessageHistory
+
+
+def est_tokens(text) -> int:
+    # ~4 characters per token, rounded up so short strings still count
+    return (len(str(text)) + 3) >> 2
+
+
+# ---------------- Heuristic summary ----------------
+_ENTITY_RE = re.compile(r"\b[A-Z][a-z]+\b")
+_PREFERENCE_RE = re.compile(r"\bI(?: really)? (?:want|need|prefer|like)\b[^.!?\n]*", re.IGNORECASE)
+_CODE_RE = re.compile(r"```.*?```", re.DOTALL)
+
+# Capitalized words that are almost always sentence starters, not names
+_NOT_ENTITIES = frozenset(
+    "A An And Also Are As At But Can Could Do Does First For Great Here Hello Hi How However If "
+    "In Is It Its Let My No Note Now Of On Our Please So Sure Thanks Thank That The Then There "
+    "This To We What When Where Which Who Why Would Yes You Your".split()
+)
+
+
+def extract_facts(messages, facts=None, max_entities=15, max_preferences=10, max_code_blocks=2) -> dict:
+    """Fold messages into a facts dict without calling an LLM.
+
+    Tracks the most recent user question, the most recently mentioned
+    capitalized names, "I want/need/prefer" statements from the user and the
+    last code blocks verbatim. Pass the facts from an earlier call to extend
+    them with newer messages only.
+    """
+    facts = dict(facts or {"question": "", "entities": [], "preferences": [], "code": []})
+    human = [str(m.content) for m in messages if getattr(m, "type", "") == "human"]
+    text = "\n".join(str(m.content) for m in messages)
+
+    entities = dict.fromkeys(facts["entities"])
+    for word in _ENTITY_RE.findall(text):
+        if word not in _NOT_ENTITIES:
+            # Re-inserting moves a name mentioned again to the end (most recent)
+            entities.pop(word, None)
+            entities[word] = None
+    preferences = facts["preferences"] + [p.strip() for content in human for p in _PREFERENCE_RE.findall(content)]
+
+    facts["question"] = human[-1][:200] if human else facts["question"]
+    facts["entities"] = list(entities)[-max_entities:]
+    facts["preferences"] = preferences[-max_preferences:]
+    facts["code"] = (facts["code"] + _CODE_RE.findall(text))[-max_code_blocks:]
+    return facts
+
+
+def format_facts(facts) -> str:
+    """Render extract_facts() output; "" when nothing beyond the question was found."""
+    if not (facts["entities"] or facts["preferences"] or facts["code"]):
+        return ""
+
+    lines = ["Summary of earlier conversation:"]
+    if facts["question"]:
+        lines.append(f"- Last question: {facts['question']}")
+    if facts["entities"]:
+        lines.append(f"- Mentioned: {', '.join(facts['entities'])}")
+    if facts["preferences"]:
+        lines.append(f"- User said: {'; '.join(facts['preferences'])}")
+    if facts["code"]:
+        lines.append("Code from earlier:")
+        lines.extend(facts["code"])
+    return "\n".join(lines)
+
+
+def heuristic_summary(messages) -> str:
+    """Summarize messages without calling an LLM (see extract_facts)."""
+    return format_facts(extract_facts(messages))
+
+
+class EstimatedSummaryBufferMemory(ConversationSummaryBufferMemory):
+    """Summary+Buffer memory that counts tokens with est_tokens.
+
+    The stock prune() asks the LLM for an exact count after every popped message,
+    which needs a local tokenizer and rescans the whole buffer each time. Here
+    each message is sized once (sizes are cached in message_sizes) and the
+    budget check is a running subtraction.
+
+    max_token_limit budgets the recent, verbatim messages only; the running
+    summary comes on top of it, as in the stock class.
+
+    Messages are never deleted from chat_memory: the oldest ones are folded into
+    the summary and skipped via summarized_upto, so the full transcript stays
+    available for display and download.
+    """
+
+    summarized_upto: int = 0
+    """Number of leading chat_memory messages already folded into the summary."""
+
+    message_sizes: list = []
+    """Cached est_tokens of each chat_memory message, in order."""
+
+    state_path: Optional[str] = None
+    """Optional JSON file the summary state is persisted to, next to a persisted chat_memory."""
+
+    def load_state(self) -> None:
+        # Reuse an earlier summary instead of paying to re-summarize after a reload
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state["summarized_upto"] <= len(self.chat_memory.messages):
+            self.moving_summary_buffer = state["summary"]
+            self.summarized_upto = state["summarized_upto"]
+
+    def save_state(self) -> None:
+        if not self.state_path:
+            return
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.moving_summary_buffer, "summarized_upto": self.summarized_upto}, f)
+
+    @property
+    def recent_messages(self):
+        return self.chat_memory.messages[self.summarized_upto:]
+
+    def _recent_with_sizes(self):
+        messages = self.chat_memory.messages
+        if len(self.message_sizes) > len(messages):
+            # History was cleared or replaced underneath us
+            self.message_sizes = []
+        self.message_sizes += [est_tokens(m.content) for m in messages[len(self.message_sizes):]]
+        return messages[self.summarized_upto:], self.message_sizes[self.summarized_upto:]
+
+    def recent_tokens(self) -> int:
+        return sum(self._recent_with_sizes()[1])
+
+    def summary_tokens(self) -> int:
+        return est_tokens(self.moving_summary_buffer)
+
+    def load_memory_variables(self, inputs):
+        # Turns are appended straight to chat_memory (not via save_context),
+        # so fold anything over budget into the summary before reading
+        self.prune()
+        buffer = self.recent_messages
+        if self.moving_summary_buffer:
+            buffer = [self.summary_message_cls(content=self.moving_summary_buffer)] + buffer
+        if not self.return_messages:
+            buffer = get_buffer_string(buffer, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        return {self.memory_key: buffer}
+
+    def prune(self) -> None:
+        recent, sizes = self._recent_with_sizes()
+        total = sum(sizes)
+        if total <= self.max_token_limit:
+            return
+
+        cut = 0
+        while total > self.max_token_limit and cut < len(recent):
+            total -= sizes[cut]
+            cut += 1
+
+        self.moving_summary_buffer = self.predict_new_summary(recent[:cut], self.moving_summary_buffer)
+        self.summarized_upto += cut
+        self.save_state()
+
+    def clear(self) -> None:
+        super().clear()
+        self.summarized_upto = 0
+        self.message_sizes = []
+        self.save_state()
+
+
+class HeuristicSummaryMemory(ConversationBufferMemory):
+    """Keeps the last keep_last messages verbatim and summarizes older ones with
+    extract_facts(), so long chats need no summarization API calls.
+
+    Summaries are incremental: each turn only the messages that just left the
+    verbatim window are scanned and folded into the stored facts. The LLM (if
+    given) is only used for a chunk in which the heuristic finds nothing, and
+    then extends its previous summary with just that chunk.
+    Like EstimatedSummaryBufferMemory, chat_memory itself is left intact.
+    """
+
+    keep_last: int = 6
+    llm: Optional[BaseLanguageModel] = None
+    facts: Optional[dict] = None
+    llm_summary: str = ""
+    summary: str = ""
+    summarized_upto: int = 0
+
+    def _refresh_summary(self, messages) -> None:
+        cut = max(len(messages) - self.keep_last, 0)
+        if cut <= self.summarized_upto:
+            return
+
+        new = messages[self.summarized_upto:cut]
+        if self.llm is not None and not format_facts(extract_facts(new)):
+            prompt = SUMMARY_PROMPT.format(summary=self.llm_summary, new_lines=get_buffer_string(new))
+            reply = self.llm.invoke(prompt)
+            self.llm_summary = getattr(reply, "content", reply)
+        self.facts = extract_facts(new, self.facts)
+
+        parts = (self.llm_summary, format_facts(self.facts))
+        self.summary = "\n\n".join(part for part in parts if part)
+        self.summarized_upto = cut
+
+    def load_memory_variables(self, inputs):
+        messages = self.chat_memory.messages
+        if len(messages) < self.summarized_upto:
+            # History was cleared or replaced underneath us
+            self.clear_summary()
+        self._refresh_summary(messages)
+
+        buffer = messages[self.summarized_upto:]
+        if self.summary:
+            buffer = [SystemMessage(content=self.summary)] + buffer
+        if not self.return_messages:
+            buffer = get_buffer_string(buffer, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        return {self.memory_key: buffer}
+
+    def clear_summary(self) -> None:
+        self.facts, self.llm_summary, self.summary, self.summarized_upto = None, "", "", 0
+
+    def clear(self) -> None:
+        super().clear()
+        self.clear_summary()
+
+
+class RelevanceMemory(ConversationBufferMemory):
+    """Feeds the prompt the top_k older messages most similar to the new input,
+    plus the last keep_last messages verbatim and any system messages.
+
+    embed maps a list of strings to vectors. Each message is embedded once, when
+    it is first seen, and scoring is a single matrix-vector product.
+    """
+
+    embed: Callable[[list], Any]
+    top_k: int = 4
+    keep_last: int = 4
+    vectors: Any = None
+    """Unit-length embeddings of chat_memory.messages, one row per message."""
+
+    def _embed(self, texts):
+        vectors = np.asarray(self.embed(texts), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _update_vectors(self, messages) -> None:
+        seen = 0 if self.vectors is None else len(self.vectors)
+        if seen > len(messages):
+            # History was cleared or replaced underneath us
+            self.vectors, seen = None, 0
+        if seen < len(messages):
+            new = self._embed([str(m.content) for m in messages[seen:]])
+            self.vectors = new if self.vectors is None else np.vstack([self.vectors, new])
+
+    def load_memory_variables(self, inputs):
+        messages = self.chat_memory.messages
+        cut = max(len(messages) - self.keep_last, 0)
+        older, recent = messages[:cut], messages[cut:]
+        query = inputs.get("input")
+
+        selected = []
+        if older and query:
+            self._update_vectors(messages)
+            scores = self.vectors[:cut] @ self._embed([query])[0]
+            top = np.sort(np.argsort(scores)[-self.top_k:])
+            selected = [older[i] for i in top]
+
+        system = [m for m in older if getattr(m, "type", "") == "system" and m not in selected]
+        buffer = system + selected + recent
+        if not self.return_messages:
+            buffer = get_buffer_string(buffer, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        return {self.memory_key: buffer}
+
+    def clear(self) -> None:
+        super().clear()
+        self.vectors = None
+
+
+class TurnHistory(BaseChatMessageHistory):
+    """Chat history handed to RunnableWithMessageHistory for a single turn.
+
+    messages is what the active memory feeds the prompt this turn (summary,
+    window, relevant messages, ...); new messages go to the persistent store.
+    """
+
+    def __init__(self, messages, store: BaseChatMessageHistory):
+        self._messages = list(messages)
+        self.store = store
+
+    @property
+    def messages(self):
+        return self._messages
+
+    def add_messages(self, messages) -> None:
+        self.store.add_messages(messages)
+
+    def clear(self) -> None:
+        self.store.clear()
+
+
+def build_chat_runnable(chain, turn_histories: dict) -> RunnableWithMessageHistory:
+    """Wrap chain so each call reads turn_histories[session_id] (a TurnHistory)
+    and records the new human/AI messages in its store when the reply is done."""
+
+    # A named function, not turn_histories.__getitem__: RunnableWithMessageHistory
+    # inspects the signature, and builtin methods have none
+    def get_session_history(session_id: str) -> BaseChatMessageHistory:
+        return turn_histories[session_id]
+
+    return RunnableWithMessageHistory(
+        chain,
+        get_session_history,
+        input_messages_key="input",
+        history_messages_key="history",
+    )
+
+
+# One lock per history file, shared by every Streamlit session in this process
+_FILE_LOCKS = {}
+_FILE_LOCKS_GUARD = threading.Lock()
+
+
+def _file_lock(path) -> threading.Lock:
+    with _FILE_LOCKS_GUARD:
+        return _FILE_LOCKS.setdefault(str(path), threading.Lock())
+
+
+class CachedFileChatMessageHistory(FileChatMessageHistory):
+    """FileChatMessageHistory that parses its JSON file once.
+
+    The stock class re-reads and parses the whole file on every .messages access
+    and once per added message. Here messages are served from memory; writes
+    re-read the file and append under a per-file lock, so two sessions sharing a
+    file (same process) never overwrite each other's turns (README: one tab per
+    session is still the supported setup).
+    """
+
+    def __init__(self, file_path, **kwargs):
+        super().__init__(file_path, **kwargs)
+        self._lock = _file_lock(self.file_path)
+        with self._lock:
+            self._messages = self._read()
+
+    def _read(self):
+        return messages_from_dict(json.loads(self.file_path.read_text(encoding=self.encoding)))
+
+    def _write(self, messages) -> None:
+        self.file_path.write_text(
+            json.dumps(messages_to_dict(messages), ensure_ascii=self.ensure_ascii), encoding=self.encoding
+        )
+
+    @property
+    def messages(self):
+        return list(self._messages)
+
+    def add_message(self, message) -> None:
+        self.add_messages([message])
+
+    def add_messages(self, messages) -> None:
+        with self._lock:
+            self._messages = self._read() + list(messages)
+            self._write(self._messages)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._messages = []
+            self._write(self._messages)
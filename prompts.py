@@ -0,0 +1,31 @@
+# prompts.py
+# -------------------------------------------------------------
+# System prompt presets per assistant mode
+# - Lives outside app.py so it is built once per process, not on every
+#   Streamlit rerun; get_preset's lookup cache lasts for the whole process
+# - The preset text never changes, so the prompt prefix sent to Groq and the
+#   prompt cache key in app.py (a hash of the text) stay the same across reruns
+# -------------------------------------------------------------
+
+import functools
+import types
+
+PRESET_PROMPTS = types.MappingProxyType({
+    "🎓 Teaching Assistant": (
+        "You are a helpful, concise teaching assistant. Use short, clear explanations, ideally within 3 lines."
+    ),
+    "👨‍💻 Coding Helper": (
+        "You are a precise coding assistant. Respond with minimal prose, correct code, and brief tips."
+    ),
+    "🌍 Translator": (
+        "You are a professional translator. Preserve meaning and tone. If user doesn't specify, translate to Roman Urdu and English side-by-side."
+    ),
+    "🧠 General Assistant": (
+        "You are a friendly, efficient assistant. Be brief, accurate, and helpful."
+    ),
+})
+
+
+@functools.cache
+def get_preset(mode: str) -> str:
+    return PRESET_PROMPTS.get(mode, PRESET_PROMPTS["🧠 General Assistant"])
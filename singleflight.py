@@ -0,0 +1,49 @@
+# singleflight.py
+# -------------------------------------------------------------
+# Collapse identical in-flight calls into one
+# - SingleFlight.do(key, fn): the first caller runs fn, concurrent callers
+#   with the same key wait for its result instead of repeating the work
+# -------------------------------------------------------------
+
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Thread-safe map of key -> Future for calls currently in progress."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Run fn() for key, or wait for the call already running with that key.
+
+        Returns (result, shared): shared is True when another caller's result
+        was reused. Failures are not shared; waiting callers retry themselves.
+        """
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                if future is None:
+                    future = self._calls[key] = Future()
+                    break
+            try:
+                return future.result(), True
+            except BaseException:
+                continue
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            self._forget(key)
+            future.set_exception(exc)
+            raise
+        self._forget(key)
+        future.set_result(result)
+        return result, False
+
+    def _forget(self, key):
+        # Drop the entry before waking waiters so a retry starts a fresh call
+        with self._lock:
+            self._calls.pop(key, None)
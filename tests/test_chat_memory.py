@@ -0,0 +1,139 @@
+from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.language_models import FakeListChatModel, FakeListLLM
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from chat_memory import (
+    CachedFileChatMessageHistory,
+    EstimatedSummaryBufferMemory,
+    HeuristicSummaryMemory,
+    RelevanceMemory,
+    TurnHistory,
+    build_chat_runnable,
+    extract_facts,
+    format_facts,
+)
+
+
+def test_runnable_streams_and_records_turn():
+    prompt = ChatPromptTemplate.from_messages(
+        [("system", "Be brief."), MessagesPlaceholder("history"), ("human", "{input}")]
+    )
+    chain = prompt | FakeListChatModel(responses=["Hello there"]) | StrOutputParser()
+    store = ChatMessageHistory()
+    turn_histories = {"sid": TurnHistory(store.messages, store)}
+    runnable = build_chat_runnable(chain, turn_histories)
+
+    chunks = list(runnable.stream({"input": "Hi"}, config={"configurable": {"session_id": "sid"}}))
+
+    assert "".join(chunks) == "Hello there"
+    assert [m.content for m in store.messages] == ["Hi", "Hello there"]
+
+
+def _turns(*pairs):
+    return [m for q, a in pairs for m in (HumanMessage(content=q), AIMessage(content=a))]
+
+
+def test_extract_facts_keeps_most_recent_entities():
+    facts = None
+    for name in ["Alice", "Bob", "Carol", "Dave"]:
+        facts = extract_facts([HumanMessage(content=f"Great, tell me about {name}")], facts, max_entities=3)
+    facts = extract_facts([HumanMessage(content="And Bob again?")], facts, max_entities=3)
+
+    assert facts["entities"] == ["Carol", "Dave", "Bob"]
+    assert "Mentioned: Carol, Dave, Bob" in format_facts(facts)
+
+
+def test_extract_facts_folds_incrementally():
+    first = extract_facts(_turns(("I prefer short answers", "Ok")))
+    both = extract_facts(_turns(("What is ```x = 1```?", "An assignment")), first)
+
+    assert both["preferences"] == ["I prefer short answers"]
+    assert both["code"] == ["```x = 1```"]
+    assert both["question"] == "What is ```x = 1```?"
+    assert format_facts(extract_facts(_turns(("hi", "hello")))) == ""
+
+
+def test_heuristic_memory_uses_llm_only_when_heuristic_finds_nothing():
+    llm = FakeListLLM(responses=["They greeted each other.", "unused"])
+    store = ChatMessageHistory()
+    memory = HeuristicSummaryMemory(llm=llm, chat_memory=store, keep_last=2, return_messages=True)
+
+    store.add_messages(_turns(("hi", "hello"), ("I need Python help", "Sure")))
+    messages = memory.load_memory_variables({})["history"]
+    assert memory.summary == "They greeted each other."
+    assert [m.content for m in messages[1:]] == ["I need Python help", "Sure"]
+
+    store.add_messages(_turns(("thanks", "welcome")))
+    memory.load_memory_variables({})
+    # Only the newly folded turn is scanned; it has facts, so no second LLM call
+    assert llm.i == 1
+    assert memory.summarized_upto == 4
+    assert memory.summary.startswith("They greeted each other.")
+    assert "User said: I need Python help" in memory.summary
+
+
+def test_summary_buffer_prunes_over_budget_and_persists_state(tmp_path):
+    state_path = str(tmp_path / "summary.json")
+    store = ChatMessageHistory()
+    store.add_messages(_turns(("a" * 40, "b" * 40), ("c" * 40, "d" * 40)))
+    memory = EstimatedSummaryBufferMemory(
+        llm=FakeListLLM(responses=["old turn"]),
+        max_token_limit=20,
+        chat_memory=store,
+        state_path=state_path,
+        return_messages=True,
+    )
+
+    messages = memory.load_memory_variables({})["history"]
+    assert memory.summarized_upto == 2
+    assert memory.recent_tokens() == 20
+    assert [m.content for m in messages] == ["old turn", "c" * 40, "d" * 40]
+    assert store.messages[0].content == "a" * 40
+
+    reloaded = EstimatedSummaryBufferMemory(
+        llm=FakeListLLM(responses=[]), chat_memory=store, state_path=state_path
+    )
+    reloaded.load_state()
+    assert (reloaded.moving_summary_buffer, reloaded.summarized_upto) == ("old turn", 2)
+
+
+def test_cached_file_history_rereads_before_writing(tmp_path):
+    path = tmp_path / "history.json"
+    first = CachedFileChatMessageHistory(str(path))
+    second = CachedFileChatMessageHistory(str(path))
+
+    first.add_messages(_turns(("one", "1")))
+    second.add_messages(_turns(("two", "2")))
+
+    assert [m.content for m in second.messages] == ["one", "1", "two", "2"]
+    assert len(CachedFileChatMessageHistory(str(path)).messages) == 4
+
+
+class _KeywordEmbedder:
+    # One dimension per keyword; counts the texts it is asked to embed
+    keywords = ["cat", "dog", "car"]
+
+    def __init__(self):
+        self.embedded = 0
+
+    def __call__(self, texts):
+        self.embedded += len(texts)
+        return [[float(k in text) + 0.01 for k in self.keywords] for text in texts]
+
+
+def test_relevance_memory_selects_top_k_and_embeds_once():
+    embed = _KeywordEmbedder()
+    store = ChatMessageHistory()
+    store.add_messages(_turns(("my cat", "nice cat"), ("my car", "fast car"), ("latest", "reply")))
+    memory = RelevanceMemory(embed=embed, chat_memory=store, top_k=2, keep_last=2, return_messages=True)
+
+    messages = memory.load_memory_variables({"input": "tell me about the car"})["history"]
+    assert [m.content for m in messages] == ["my car", "fast car", "latest", "reply"]
+    assert embed.embedded == 6 + 1
+
+    store.add_messages(_turns(("more", "text")))
+    memory.load_memory_variables({"input": "cat"})
+    # Only the two new messages and the query are embedded
+    assert embed.embedded == 7 + 2 + 1
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def _wait_for_call(flight, key):
+    # Spin until the leader has registered its in-flight call
+    while key not in flight._calls:
+        pass
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait()
+        return "reply"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    _wait_for_call(flight, "k")
+    waiter = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    waiter.start()
+    time.sleep(0.1)  # let the waiter block on the leader's call
+    release.set()
+    leader.join()
+    waiter.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("reply", False), ("reply", True)]
+    assert flight._calls == {}
+
+
+def test_waiter_retries_after_leader_fails():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait()
+        raise RuntimeError("boom")
+
+    errors, results = [], []
+
+    def lead():
+        try:
+            flight.do("k", failing)
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    _wait_for_call(flight, "k")
+    waiter = threading.Thread(target=lambda: results.append(flight.do("k", lambda: "retried")))
+    waiter.start()
+    time.sleep(0.1)  # let the waiter block on the leader's call
+    release.set()
+    leader.join()
+    waiter.join()
+
+    assert len(errors) == 1
+    assert results == [("retried", False)]
+
+
+def test_failure_propagates_to_caller():
+    with pytest.raises(ValueError):
+        SingleFlight().do("k", lambda: int("x"))